@@ -185,7 +185,9 @@ def update_inverted_index(collocations_map, inverted_index, img_id):
         add_key_to_map_arr(key=k, value=img_id.split('.')[0],
                            map_=inverted_index)  # e.g., person overlaps_with ball -> [img_id_5, img_id_72 ...]p
     #print(f"inverted_index: {inverted_index}")
-if __name__ == "__main__":
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description='Code to generate spatial collocations',
                                      usage="\n\npython collocation_detector.py"
                                            "\t --input_dir "
@@ -202,8 +204,14 @@ if __name__ == "__main__":
                         dest='output_dir',
                         required=True,
                         help='Directory where resulting collocations_map and inverted_index is stored')
+    return parser
+
 
-    args = parser.parse_args()
+def main(args):
+    ''' Detects collocations in every csv file of args.input_dir and writes
+    collocations.tsv and inverted_index.tsv to args.output_dir.
+    @param: args: namespace from build_parser()
+    '''
     inverted_index = {}  # triple -> arr_of_img_ids
     collocations_map = {}  # triple -> count
     for infile_path in compile_input_files(dir_or_file_path=args.input_dir):
@@ -226,3 +234,7 @@ if __name__ == "__main__":
 
     print(f"Sample Top-20 collocations are:\n{topk(ordered_dic=collocations_map, k=20, as_str=True)}")
     print(f"\n\nOutput written to directory: {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())
@@ -1,51 +1,178 @@
-import csv
+import os
+import itertools
 import pandas as pd
 import argparse
 import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
+ERROR_FILE_PATH = "output/tsv_files/error_set.tsv"
+ERROR_FILE_BUFFER_SIZE = 1 << 20
+# Inverted-index rows parsed per chunk; an index that fits in a single chunk
+# is checked inline, since starting worker processes would cost more than it saves.
+CHUNK_ROWS = 100_000
+# Labels whose mutual 'overlapsWith' relation is never reported as an error.
+VEHICLE_OR_PERSON = frozenset(('person', 'truck', 'bus', 'car'))
 
-def check_csk(csk_file_path, inverted_index_path):
+
+def kb_relations(csk_data):
+    """
+    Flattens the CSK matrix into long-form tables.
+    Args:
+        csk_data (pd.DataFrame): CSK matrix indexed by label1 with one column per label2.
+            Cells must already be strings (empty rather than NaN), as load_kb reads them.
+    Returns:
+        tuple: (cells, relations) where cells has one row per (label1, label2)
+        pair with its raw KB cell, and relations one row per allowed relation.
+    """
+    cells = csk_data.stack().reset_index()
+    cells.columns = ['label1', 'label2', 'cell']
+    relations = cells.assign(relation=cells['cell'].str.split(',')).explode('relation')
+    relations['relation'] = relations['relation'].str.strip()
+    relations = relations[['label1', 'label2', 'relation']].drop_duplicates()
+    return cells, relations
+
+
+def load_kb(csk_file_path):
+    """
+    Loads the CSK file and prepares it for error checking.
+    Args:
+        csk_file_path (str): Path to the CSK CSV file.
+    Returns:
+        tuple: (cells, relations) as returned by kb_relations.
+    """
+    csk_data = pd.read_csv(csk_file_path, index_col=0, engine='c', dtype=str,
+                           keep_default_na=False, low_memory=False)
+    return kb_relations(csk_data)
+
+
+def find_errors(index, kb):
+    """
+    Finds the inverted-index triples whose relation is not allowed by the KB.
+    Args:
+        index (pd.DataFrame): Inverted-index rows with 'triple' and 'img_ids' columns.
+        kb (tuple): KB tables as returned by load_kb.
+    Returns:
+        list: Error lines for error_set.tsv, in inverted-index order.
+    """
+    kb_cells, kb_rels = kb
+    index = index[index['img_ids'] != '']  # skip lines without image IDs (no tab)
+
+    triples = index['triple'].str.split(',')
+    index = index[triples.str.len() == 3]  # skip malformed triples
+    if index.empty:
+        return []
+    index = index.assign(label1=triples.str[0], relation=triples.str[1], label2=triples.str[2])
+
+    # Skip if relation is 'overlapsWith' and both labels are vehicles/person;
+    # the cheap relation test narrows the rows before the label lookups.
+    overlaps = index[index['relation'] == 'overlapsWith']
+    excluded = overlaps.index[
+        overlaps['label1'].isin(VEHICLE_OR_PERSON) & overlaps['label2'].isin(VEHICLE_OR_PERSON)
+    ]
+    index = index.drop(excluded)
+
+    # The inner merge drops triples whose labels are not in the KB. Of the
+    # rest, those whose relation has no match among the allowed KB relations
+    # are errors; the row position keeps the output in inverted-index order.
+    checked = index.reset_index(drop=True).rename_axis('position').reset_index()
+    checked = checked.merge(kb_cells, on=['label1', 'label2'])
+    checked = checked.merge(kb_rels, on=['label1', 'label2', 'relation'], how='left', indicator=True)
+    errors = checked[checked['_merge'] == 'left_only'].sort_values('position')
+
+    lines = (errors['img_ids'] + '\t' + errors['triple'] + '\t' +
+             errors['label1'] + ',' + errors['cell'] + ',' + errors['label2'] + '\n')
+    return lines.tolist()
+
+
+def write_errors(chunk_errors):
+    """
+    Appends error lines to error_set.tsv with one writelines call per chunk.
+    The file is only opened once a chunk has errors, so a clean run leaves
+    no error_set.tsv behind.
+    Args:
+        chunk_errors (iterable): Lists of error lines, one list per chunk.
+    """
+    outfile = None
+    try:
+        for lines in chunk_errors:
+            if not lines:
+                continue
+            if outfile is None:
+                outfile = open(ERROR_FILE_PATH, "a", buffering=ERROR_FILE_BUFFER_SIZE)
+            outfile.writelines(lines)
+    finally:
+        if outfile is not None:
+            outfile.close()
+
+
+# KB tables of a worker process, loaded once by _init_worker.
+_worker_kb = None
+
+
+def _init_worker(csk_file_path, kb=None):
+    global _worker_kb
+    _worker_kb = kb if kb is not None else load_kb(csk_file_path)
+
+
+def _check_chunk(index):
+    return find_errors(index, _worker_kb)
+
+
+def map_in_order(pool, fn, items, window):
+    """
+    Maps fn over items on the pool, yielding results in input order.
+    Unlike Executor.map, at most window items are in flight at a time, so a
+    lazy iterable such as a chunked reader is not drained up front.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def check_csk(csk_file_path, inverted_index_path, kb=None):
     """
     Checks for errors in the CSK file based on the inverted index.
     Writes errors to 'error_set.tsv' if a relation is missing between labels.
+    The inverted index is streamed in chunks of CHUNK_ROWS rows; when there
+    is more than one, they are checked across a process pool.
     Args:
         csk_file_path (str): Path to the CSK CSV file.
         inverted_index_path (str): Path to the inverted index TSV file.
+        kb (tuple, optional): The CSK file already loaded by load_kb, so
+            callers can load it while the inverted index is being built.
     """
-    csv.field_size_limit(10000000)
-    with open(csk_file_path) as csv_file:
-        csk_data = pd.read_csv(csv_file, index_col=0)
-    labels = list(csk_data.columns)
-
-    with open(inverted_index_path) as tsv_file:
-        tsv_reader = csv.reader(tsv_file, delimiter="\t")
-        for row in tsv_reader:
-            # row example: ['person,is_near,bicycle', 'test1.csv,test4.csv']
-            if len(row) < 2:
-                continue  # skip malformed rows
-            triple_str, img_ids = row[0], row[1]
-            triple = triple_str.split(',')
-            if len(triple) != 3:
-                continue  # skip malformed triples
-            label1, relation, label2 = triple
-
-            # Skip if both labels are vehicles/person and relation is 'overlapsWith'
-            if (
-                label1 in ['person', 'truck', 'bus', 'car'] and
-                label2 in ['person', 'truck', 'bus', 'car'] and
-                relation == 'overlapsWith'
-            ):
-                continue
+    try:
+        # row example: 'person,is_near,bicycle\ttest1.csv,test4.csv'
+        chunks = pd.read_csv(inverted_index_path, sep='\t', header=None, names=['triple', 'img_ids'],
+                             engine='c', dtype=str, keep_default_na=False, chunksize=CHUNK_ROWS)
+    except pd.errors.EmptyDataError:
+        return
 
-            if label1 in labels and label2 in labels:
-                cell_value = csk_data.loc[label1][label2]
-                relations = [rel.strip() for rel in str(cell_value).split(',')]
-                if relation not in relations:
-                    with open("output/tsv_files/error_set.tsv", "a+") as outfile:
-                        outfile.write(f"{img_ids}\t{triple_str}\t{label1},{cell_value},{label2}\n")
+    first_chunk = next(chunks, None)
+    second_chunk = next(chunks, None)
+    if second_chunk is None:
+        if first_chunk is not None:
+            write_errors([find_errors(first_chunk, kb if kb is not None else load_kb(csk_file_path))])
+        return
 
+    workers = os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(csk_file_path, kb)) as pool:
+        write_errors(map_in_order(pool, _check_chunk, itertools.chain([first_chunk, second_chunk], chunks),
+                                  window=2 * workers))
 
-if __name__ == '__main__':
+
+def build_parser():
+    """
+    Builds the command line parser for the error checker.
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
     parser = argparse.ArgumentParser(
         description='CSK error checker (csk_error_checker.py)',
         usage="\npython csk_error_checker.py\t --csk_dir \t --inverted_index_dir"
@@ -64,5 +191,18 @@ if __name__ == '__main__':
         required=True,
         help='Directory where inverted_index is stored'
     )
-    args = parser.parse_args()
-    check_csk(args.csk_dir, args.inverted_index_dir)
+    return parser
+
+
+def main(args, kb=None):
+    """
+    Checks the CSK file named by the parsed command line arguments.
+    Args:
+        args (argparse.Namespace): Arguments parsed by build_parser().
+        kb (tuple, optional): The CSK file already loaded by load_kb.
+    """
+    check_csk(args.csk_dir, args.inverted_index_dir, kb=kb)
+
+
+if __name__ == '__main__':
+    main(build_parser().parse_args())
@@ -6,14 +6,20 @@ commonsense knowledge relationships between detected objects.
 """
 
 import os
+import re
+import csv
 import shutil
 import logging
+import functools
+import itertools
+import threading
 from pathlib import Path
-from subprocess import Popen, PIPE
-from typing import Dict, List, Optional, Any, Tuple
+from typing import AbstractSet, Dict, Iterator, List, Optional, Any
 
 import pandas as pd
-from flask import Flask, render_template, request, session, send_from_directory
+from flask import Flask, Response, render_template, request, session, send_from_directory, stream_with_context
+
+import main as csk_main
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -36,24 +42,28 @@ class Config:
     TSV_DIR = OUTPUT_DIR / 'tsv_files'
     
     # File patterns
-    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
-    CSV_EXTENSION = '.csv'
-    TSV_EXTENSION = '.tsv'
+    IMAGE_EXTENSIONS = frozenset(('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'))
+    CSV_EXTENSIONS = frozenset(('.csv',))
+    TSV_EXTENSIONS = frozenset(('.tsv',))
+    IMAGE_NUMBER_PATTERN = re.compile(r'Image\s*(\d+)')
     
     # Important files
     KB_FILE = Path('KB-CSK-SNIFFER.csv')
     ERROR_FILE = TSV_DIR / 'error_set.tsv'
     COLLOCATIONS_FILE = TSV_DIR / 'collocations.tsv'
     INVERTED_INDEX_FILE = TSV_DIR / 'inverted_index.tsv'
-    
-    # Main script
-    MAIN_SCRIPT = Path('main.py')
 
 # Initialize Flask app
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = str(Config.IMAGES_DIR)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
 
+# The pipeline and the cleanup routes share fixed output paths, so only one
+# of them may touch the output at a time. Holders take it without blocking
+# and tell the user a search is running instead of waiting for it.
+pipeline_lock = threading.Lock()
+SEARCH_RUNNING_MESSAGE = "A search is already running. Please wait for it to finish and try again."
+
 
 def ensure_directories_exist() -> None:
     """Ensure all required directories exist."""
@@ -63,12 +73,35 @@ def ensure_directories_exist() -> None:
         logger.info(f"Ensured directory exists: {directory}")
 
 
+def iter_files(directory: Path, extensions: AbstractSet[str]) -> Iterator[os.DirEntry]:
+    """
+    Yield the regular files in a directory whose suffix is one of the extensions.
+    
+    A single os.scandir pass replaces one glob per extension, and
+    DirEntry.is_file() normally answers from the directory listing without
+    an extra stat(). The suffix is cut from the raw entry name and looked up
+    in a set, with no Path objects built per file.
+    
+    Args:
+        directory: Directory to scan
+        extensions: Set of lower-case suffixes including the dot, e.g. {'.csv'}
+        
+    Yields:
+        Matching directory entries
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            _, dot, suffix = entry.name.rpartition('.')
+            if dot and '.' + suffix.lower() in extensions and entry.is_file():
+                yield entry
+
+
 def cleanup_previous_search() -> None:
     """
     Clean up files from previous searches to ensure clean state for new search.
     
     Removes:
-    - Image files from the images directory
+    - The whole images directory (images, YOLO output, download history)
     - CSV files from csv_files directory
     - TSV files from tsv_files directory
     - error_set.tsv file
@@ -77,27 +110,23 @@ def cleanup_previous_search() -> None:
     - KB-CSK-SNIFFER.csv (original KB file)
     """
     try:
-        # Clean up images directory
+        # Clean up images directory; everything in it belongs to the last search
         if Config.IMAGES_DIR.exists():
-            for file_path in Config.IMAGES_DIR.iterdir():
-                if file_path.is_file() and file_path.suffix.lower() in Config.IMAGE_EXTENSIONS:
-                    file_path.unlink()
-                    logger.info(f"Deleted image: {file_path.name}")
-                elif file_path.is_dir():
-                    shutil.rmtree(file_path)
-                    logger.info(f"Deleted directory: {file_path.name}")
+            shutil.rmtree(Config.IMAGES_DIR, ignore_errors=True)
+            logger.info(f"Deleted images directory: {Config.IMAGES_DIR}")
+        Config.IMAGES_DIR.mkdir(parents=True, exist_ok=True)
         
         # Clean up CSV files
         if Config.CSV_DIR.exists():
-            for file_path in Config.CSV_DIR.glob(f"*{Config.CSV_EXTENSION}"):
-                file_path.unlink()
-                logger.info(f"Deleted CSV: {file_path.name}")
+            for entry in iter_files(Config.CSV_DIR, Config.CSV_EXTENSIONS):
+                os.unlink(entry.path)
+                logger.info(f"Deleted CSV: {entry.name}")
         
         # Clean up TSV files
         if Config.TSV_DIR.exists():
-            for file_path in Config.TSV_DIR.glob(f"*{Config.TSV_EXTENSION}"):
-                file_path.unlink()
-                logger.info(f"Deleted TSV: {file_path.name}")
+            for entry in iter_files(Config.TSV_DIR, Config.TSV_EXTENSIONS):
+                os.unlink(entry.path)
+                logger.info(f"Deleted TSV: {entry.name}")
         
         # Clean up error file
         if Config.ERROR_FILE.exists():
@@ -109,6 +138,7 @@ def cleanup_previous_search() -> None:
         session['cache_buster'] = current_buster + 1
         logger.info(f"Cache buster incremented to: {session['cache_buster']}")
         
+        session['has_output'] = False
         logger.info("Cleanup completed successfully!")
         
     except Exception as e:
@@ -116,30 +146,110 @@ def cleanup_previous_search() -> None:
         # Don't raise the exception to prevent the app from crashing
 
 
-def run_main_script(query: str) -> Tuple[bytes, bytes]:
+@functools.lru_cache(maxsize=4)
+def _load_kb(path: str, mtime_ns: int) -> pd.DataFrame:
+    """
+    Parse the KB CSV file with the C engine and no type inference.
+    
+    The modification time is part of the cache key, so an edited KB is
+    parsed again while repeated page views reuse the result.
+    """
+    return pd.read_csv(path, engine='c', dtype=str, keep_default_na=False)
+
+
+def load_kb() -> pd.DataFrame:
     """
-    Run the main.py script with the given query.
+    Load the KB file through its mtime-keyed parse cache.
+    
+    Returns:
+        Cached DataFrame; callers must not modify it in place
+    """
+    return _load_kb(str(Config.KB_FILE), Config.KB_FILE.stat().st_mtime_ns)
+
+
+def stream_template(template_name: str, **context: Any) -> Iterator[str]:
+    """
+    Render a template incrementally instead of into a single string.
     
     Args:
-        query: The search term to process
+        template_name: Name of the template to render
+        **context: Template variables
         
     Returns:
-        Tuple of (stdout, stderr) from the subprocess
+        Iterator over the rendered chunks
+    """
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return template.generate(context)
+
+
+def render_tsv_table(name: str, path: Path, columns: List[str], empty_error: str) -> Response:
+    """
+    Render a TSV output file as an HTML table, streaming it row by row.
+    
+    Rows go from csv.reader through the template to the client without a
+    DataFrame in between, so memory use does not grow with the file and
+    the first rows are sent while the rest is still being read.
+    
+    Args:
+        name: Page title
+        path: TSV file to display
+        columns: Column headers for the table
+        empty_error: Error message shown when the file has no rows
+        
+    Returns:
+        Streaming response, or the regular error page if the file is empty
+    """
+    tsv_file = open(path, newline='')
+    try:
+        rows = csv.reader(tsv_file, delimiter='\t')
+        first_row = next(rows, None)
+    except Exception:
+        tsv_file.close()
+        raise
+    
+    if first_row is None:
+        tsv_file.close()
+        return render_template("collocation.html", name=name, data=pd.DataFrame(), error=empty_error)
+    
+    def generate() -> Iterator[str]:
+        with tsv_file:
+            yield from stream_template("collocation.html", name=name, columns=columns,
+                                       rows=itertools.chain([first_row], rows))
+    
+    return Response(stream_with_context(generate()), mimetype='text/html')
+
+
+def run_main_script(query: str) -> None:
     """
-    if not Config.MAIN_SCRIPT.exists():
-        raise FileNotFoundError(f"Main script not found: {Config.MAIN_SCRIPT}")
+    Run the main.py pipeline with the given query.
     
-    cmd = ['python', str(Config.MAIN_SCRIPT), '--image_search_term', query]
-    process = Popen(cmd, stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    stdout, stderr = process.communicate()
+    The pipeline is called in-process rather than through a new Python
+    interpreter, so there is no start-up cost per search. The caller must
+    hold pipeline_lock.
     
-    logger.info(f"Main script execution completed with return code: {process.returncode}")
-    if stderr:
-        logger.warning(f"Main script stderr: {stderr.decode()}")
-    if stdout:
-        logger.info(f"Main script stdout: {stdout.decode()}")
+    Args:
+        query: The search term to process
+    """
+    csk_main.run(query)
+    
+    logger.info("Main script execution completed")
+
+
+def extract_image_number(filename: str) -> int:
+    """
+    Extract the sequence number from an "Image X.jpg" / "ImageX.jpg" filename.
     
-    return stdout, stderr
+    Args:
+        filename: Image file name
+        
+    Returns:
+        The image number, or 0 if the name does not follow the pattern
+    """
+    match = Config.IMAGE_NUMBER_PATTERN.search(filename)
+    if match:
+        return int(match.group(1))
+    return 0
 
 
 def get_image_files() -> List[Dict[str, Any]]:
@@ -154,28 +264,16 @@ def get_image_files() -> List[Dict[str, Any]]:
             return []
         
         # Get all image files and sort them properly
-        image_paths = []
-        for file_path in Config.IMAGES_DIR.iterdir():
-            if file_path.is_file() and file_path.suffix.lower() in Config.IMAGE_EXTENSIONS:
-                image_paths.append(file_path)
-        
-        # Sort files by extracting the number from the filename
-        def extract_number(filename):
-            # Extract number from "Image X.jpg" format
-            import re
-            match = re.search(r'Image\s*(\d+)', filename)
-            if match:
-                return int(match.group(1))
-            return 0
+        image_names = [entry.name for entry in iter_files(Config.IMAGES_DIR, Config.IMAGE_EXTENSIONS)]
         
-        # Sort by the extracted number
-        image_paths.sort(key=lambda x: extract_number(x.name))
+        # Sort by the number extracted from the filename
+        image_names.sort(key=extract_image_number)
         
         # Create the image files list with proper indexing
         image_files = []
-        for i, file_path in enumerate(image_paths, 1):
+        for i, filename in enumerate(image_names, 1):
             image_files.append({
-                'filename': file_path.name,
+                'filename': filename,
                 'caption': f'Image {i}',
                 'index': i
             })
@@ -187,17 +285,50 @@ def get_image_files() -> List[Dict[str, Any]]:
         return []
 
 
-def has_any_output_files() -> bool:
+def has_any_output_files(status_info: Optional[Dict[str, Any]] = None) -> bool:
     """
     Check if any output files exist from a previous search.
     
+    Args:
+        status_info: Result of get_status_info, whose existence flags and
+            image count are reused instead of being checked again
+    
     Returns:
         True if any output files exist, False otherwise
     """
-    return (Config.COLLOCATIONS_FILE.exists() or 
+    if status_info is not None:
+        if (status_info['collocations_exists'] or
+                status_info['inverted_exists'] or
+                status_info['error_exists'] or
+                status_info['images_count'] > 0):
+            return True
+    elif (Config.COLLOCATIONS_FILE.exists() or
             Config.INVERTED_INDEX_FILE.exists() or
-            Config.ERROR_FILE.exists() or
-            any(Config.IMAGES_DIR.glob("*")))
+            Config.ERROR_FILE.exists()):
+        return True
+    try:
+        with os.scandir(Config.IMAGES_DIR) as entries:
+            for _ in entries:
+                return True
+    except OSError:
+        pass
+    return False
+
+
+def has_search_results() -> bool:
+    """
+    Check whether search results are available, preferring the session flag.
+    
+    The flag is set by process_search and cleared by cleanup_previous_search,
+    so page renders only touch the disk when the session has no answer yet.
+    
+    Returns:
+        True if output files from a previous search are available
+    """
+    has_output = session.get('has_output')
+    if has_output is None:
+        return has_any_output_files()
+    return has_output
 
 
 def get_status_info() -> Dict[str, Any]:
@@ -214,26 +345,24 @@ def get_status_info() -> Dict[str, Any]:
         'csv_files_count': 0,
         'tsv_files_count': 0,
         'has_error_file': False,
-        'has_any_output': False
+        'has_any_output': False,
+        'collocations_exists': Config.COLLOCATIONS_FILE.exists(),
+        'inverted_exists': Config.INVERTED_INDEX_FILE.exists(),
+        'error_exists': Config.ERROR_FILE.exists()
     }
     
     # Count files
     if Config.IMAGES_DIR.exists():
-        image_files = list(Config.IMAGES_DIR.glob(f"*{Config.IMAGE_EXTENSIONS[0]}"))
-        for ext in Config.IMAGE_EXTENSIONS[1:]:
-            image_files.extend(Config.IMAGES_DIR.glob(f"*{ext}"))
-        status_info['images_count'] = len(image_files)
+        status_info['images_count'] = sum(1 for _ in iter_files(Config.IMAGES_DIR, Config.IMAGE_EXTENSIONS))
     
     if Config.CSV_DIR.exists():
-        csv_files = list(Config.CSV_DIR.glob(f"*{Config.CSV_EXTENSION}"))
-        status_info['csv_files_count'] = len(csv_files)
+        status_info['csv_files_count'] = sum(1 for _ in iter_files(Config.CSV_DIR, Config.CSV_EXTENSIONS))
     
     if Config.TSV_DIR.exists():
-        tsv_files = list(Config.TSV_DIR.glob(f"*{Config.TSV_EXTENSION}"))
-        status_info['tsv_files_count'] = len(tsv_files)
+        status_info['tsv_files_count'] = sum(1 for _ in iter_files(Config.TSV_DIR, Config.TSV_EXTENSIONS))
     
-    status_info['has_error_file'] = Config.ERROR_FILE.exists()
-    status_info['has_any_output'] = has_any_output_files()
+    status_info['has_error_file'] = status_info['error_exists']
+    status_info['has_any_output'] = has_any_output_files(status_info)
     
     return status_info
 
@@ -243,7 +372,7 @@ def get_status_info() -> Dict[str, Any]:
 def search_page():
     """Render the main search page."""
     # Check if there are existing search results
-    has_results = has_any_output_files()
+    has_results = has_search_results()
     return render_template('search_page.html', has_results=has_results)
 
 
@@ -254,7 +383,10 @@ def process_search():
         query = request.form.get('t', '').strip()
         
         if not query:
-            return render_template('search_page.html', error="Please enter a search term.", has_results=has_any_output_files())
+            return render_template('search_page.html', error="Please enter a search term.", has_results=has_search_results())
+        
+        if not pipeline_lock.acquire(blocking=False):
+            return render_template('search_page.html', error=SEARCH_RUNNING_MESSAGE, has_results=has_search_results())
         
         try:
             # Store search info in session
@@ -265,18 +397,23 @@ def process_search():
             cleanup_previous_search()
             
             # Run the main processing script
-            stdout, stderr = run_main_script(query)
+            run_main_script(query)
             
+            session['has_output'] = has_any_output_files()
             logger.info(f"Search completed for query: {query}")
             return render_template('home_page.html', query=query)
             
         except Exception as e:
             logger.error(f"Error processing search '{query}': {e}")
+            # A failed run may have left partial output, so re-check the disk
+            session.pop('has_output', None)
             return render_template('search_page.html', 
                                  error=f"An error occurred while processing your search: {str(e)}",
-                                 has_results=has_any_output_files())
+                                 has_results=has_search_results())
+        finally:
+            pipeline_lock.release()
     
-    return render_template('search_page.html', has_results=has_any_output_files())
+    return render_template('search_page.html', has_results=has_search_results())
 
 
 @app.route('/home_page')
@@ -294,7 +431,12 @@ def about_page():
 @app.route('/cleanup')
 def manual_cleanup():
     """Manual cleanup route to clear all files from previous searches."""
-    cleanup_previous_search()
+    if not pipeline_lock.acquire(blocking=False):
+        return render_template('search_page.html', error=SEARCH_RUNNING_MESSAGE, has_results=has_search_results())
+    try:
+        cleanup_previous_search()
+    finally:
+        pipeline_lock.release()
     return render_template('search_page.html', 
                           message="All previous search files have been cleaned up. You can now perform a new search.",
                           has_results=False)
@@ -303,7 +445,12 @@ def manual_cleanup():
 @app.route('/new_search')
 def new_search():
     """New search route that cleans up previous files and redirects to search page."""
-    cleanup_previous_search()
+    if not pipeline_lock.acquire(blocking=False):
+        return render_template('search_page.html', error=SEARCH_RUNNING_MESSAGE, has_results=has_search_results())
+    try:
+        cleanup_previous_search()
+    finally:
+        pipeline_lock.release()
     return render_template('search_page.html', 
                           message="Previous search files have been cleared. You can now perform a new search.",
                           has_results=False)
@@ -320,18 +467,17 @@ def clear_cache():
 
 @app.route('/images/<filename>')
 def serve_image(filename):
-    """Serve images with cache control headers."""
+    """Serve images as conditional responses validated by ETag/Last-Modified."""
     # Check if the image file exists
     image_path = Config.IMAGES_DIR / filename
     if not image_path.exists():
         return "Image not found", 404
     
-    # Set cache control headers to prevent aggressive caching
-    response = send_from_directory(Config.IMAGES_DIR, filename)
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate, max-age=0'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    response.headers['Last-Modified'] = 'Thu, 01 Jan 1970 00:00:00 GMT'
+    # The browser revalidates on every view, so an image replaced by a new
+    # search is fetched again while an unchanged one costs a 304 Not Modified
+    response = send_from_directory(Config.IMAGES_DIR, filename, conditional=True)
+    response.cache_control.no_cache = True
+    response.cache_control.max_age = 0
     return response
 
 
@@ -350,17 +496,17 @@ def output_status():
     # Check specific file statuses
     file_status = {
         'collocations': {
-            'exists': Config.COLLOCATIONS_FILE.exists(),
+            'exists': status_info['collocations_exists'],
             'name': 'Collocations Map (collocations.tsv)',
             'description': 'Contains spatial relationship data between detected objects'
         },
         'inverted_index': {
-            'exists': Config.INVERTED_INDEX_FILE.exists(),
+            'exists': status_info['inverted_exists'],
             'name': 'Inverted Index (inverted_index.tsv)',
             'description': 'Contains mapping between spatial relationships and image IDs'
         },
         'error_set': {
-            'exists': Config.ERROR_FILE.exists(),
+            'exists': status_info['error_exists'],
             'name': 'Error Set (error_set.tsv)',
             'description': 'Contains detected errors in object relationships'
         },
@@ -397,15 +543,9 @@ def get_collocations_map():
                                  data=pd.DataFrame(),
                                  error="The collocations.tsv output file is missing. This file contains spatial relationship data between detected objects. Please run a search first to generate this file.")
         
-        data = pd.read_csv(Config.COLLOCATIONS_FILE, sep='\t')
-        if data.empty:
-            return render_template("collocation.html", 
-                                 name='Collocations Map', 
-                                 data=data,
-                                 error="The collocations file exists but contains no data. This might indicate that no spatial relationships were detected in the processed images.")
-        
-        data.columns = ["Inferred spatial relation on predicted bounding boxes", "Frequency"]
-        return render_template("collocation.html", name='Collocations Map', data=data)
+        return render_tsv_table('Collocations Map', Config.COLLOCATIONS_FILE,
+                                ["Inferred spatial relation on predicted bounding boxes", "Frequency"],
+                                "The collocations file exists but contains no data. This might indicate that no spatial relationships were detected in the processed images.")
         
     except Exception as e:
         logger.error(f"Error loading collocations: {e}")
@@ -425,15 +565,9 @@ def get_inverted_index():
                                  data=pd.DataFrame(),
                                  error="The inverted_index.tsv output file is missing. This file contains the mapping between spatial relationships and image IDs. Please run a search first to generate this file.")
         
-        data = pd.read_csv(Config.INVERTED_INDEX_FILE, sep='\t')
-        if data.empty:
-            return render_template("collocation.html", 
-                                 name='Inverted Index', 
-                                 data=data,
-                                 error="The inverted index file exists but contains no data. This might indicate that no spatial relationships were detected in the processed images.")
-        
-        data.columns = ["Inferred spatial relation on predicted bounding boxes", "Image ID"]
-        return render_template("collocation.html", name='Inverted Index', data=data)
+        return render_tsv_table('Inverted Index', Config.INVERTED_INDEX_FILE,
+                                ["Inferred spatial relation on predicted bounding boxes", "Image ID"],
+                                "The inverted index file exists but contains no data. This might indicate that no spatial relationships were detected in the processed images.")
         
     except Exception as e:
         logger.error(f"Error loading inverted index: {e}")
@@ -448,7 +582,8 @@ def get_error_set():
     """Display error set data."""
     try:
         if not Config.ERROR_FILE.exists():
-            # Check if any search has been performed by looking for other output files
+            # Check if any search has been performed by looking for other output files.
+            # The files are shared by all clients, so ask the disk, not the session.
             if has_any_output_files():
                 # Create a DataFrame with a success message when no errors are detected
                 success_data = pd.DataFrame({
@@ -464,16 +599,10 @@ def get_error_set():
                                      data=pd.DataFrame(),
                                      error="No error set data available. Please run a search first to generate output files and error analysis.")
         
-        data = pd.read_csv(Config.ERROR_FILE, sep='\t')
-        if data.empty:
-            return render_template("collocation.html", 
-                                 name='Error Set', 
-                                 data=data,
-                                 error="The error set file exists but contains no data. This might indicate that no errors were detected during processing.")
-        
-        data.columns = ["Image ID", "Inferred Spatial Relation on Predicted Bounding Boxes", 
-                       "Expected Spatial Relation between these objects present in KB"]
-        return render_template("collocation.html", name='Error Set', data=data)
+        return render_tsv_table('Error Set', Config.ERROR_FILE,
+                                ["Image ID", "Inferred Spatial Relation on Predicted Bounding Boxes", 
+                                 "Expected Spatial Relation between these objects present in KB"],
+                                "The error set file exists but contains no data. This might indicate that no errors were detected during processing.")
         
     except Exception as e:
         logger.error(f"Error loading error set: {e}")
@@ -493,7 +622,7 @@ def get_csk_graph():
                                  data=pd.DataFrame(),
                                  error="The KB-CSK-SNIFFER.csv file is missing. This file contains the commonsense knowledge base that the system uses for analysis.")
         
-        data = pd.read_csv(Config.KB_FILE)
+        data = load_kb()
         if data.empty:
             return render_template("index.html", 
                                  name='Common Sense Knowledge Graph', 
@@ -1,18 +1,16 @@
 import argparse
-import hashlib
-import imghdr
+import asyncio
+import atexit
 import os
 import pickle
 import posixpath
+import queue
 import re
 import signal
-import socket
-import ssl
-import threading
-import time
 import urllib.parse
-import urllib.request
-import urllib.error
+
+import aiohttp
+import xxhash
 
 # Configuration constants
 DEFAULT_OUTPUT_DIR = './bing'
@@ -20,49 +18,103 @@ DEFAULT_TIMEOUT = 2
 DEFAULT_LIMIT = 5
 DEFAULT_THREADS = 20
 DEFAULT_IMAGES_PER_REQUEST = 35
-MAX_CONCURRENT_DOWNLOADS = 10
-SLEEP_INTERVAL = 0.1
 DELAY_BETWEEN_KEYWORDS = 10
+READ_CHUNK_SIZE = 1 << 16  # 64 KiB
+IMAGE_BUFFER_SIZE = 256 << 10  # 256 KiB to start, grown in place for larger images
+MAX_POOLED_BUFFER_SIZE = 4 << 20  # Buffers grown past 4 MiB are not reused
+
+# URL extensions kept as-is; anything else is saved as .jpg
+ALLOWED_EXTENSIONS = frozenset(('jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp'))
+EXTENSION_JUNK_PATTERN = re.compile(r'[^a-z0-9]')
+
+# Image URLs embedded in Bing's async result pages
+MURL_PATTERN = re.compile(r'murl&quot;:&quot;(.*?)&quot;')
 
 # User agent for web requests
 USER_AGENT = 'Mozilla/5.0 (X11; Fedora; Linux x86_64; rv:94.0) Gecko/20100101 Firefox/94.0'
 
 # Global state variables
 output_dir = DEFAULT_OUTPUT_DIR
-socket.setdefaulttimeout(DEFAULT_TIMEOUT)
 
-# Create SSL context to bypass certificate verification
-ssl_context = ssl.create_default_context()
-ssl_context.check_hostname = False
-ssl_context.verify_mode = ssl.CERT_NONE
+# Shared aiohttp session and download throttle, both opened by run_downloads().
+# Keep-alive connections are reused across images and Bing result pages.
+session = None
+download_slots = None  # asyncio.Semaphore bounding concurrent downloads
 
-# Global tracking variables
-tried_urls = []
-image_md5s = {}
-in_progress = 0
+# Global tracking variables. Downloads all run on one event loop and never
+# await between reading and updating these, so they need no lock.
+tried_urls = set()
+image_hashes = {}
+buffer_pool = queue.Queue()  # Reusable download buffers, at most one per download slot; emptied after each run
 image_counter = 0  # Global counter for sequential image naming
 successful_downloads = 0  # Counter for successfully downloaded images
 urlopenheader = {'User-Agent': USER_AGENT}
 
 
-def download(pool_sema: threading.Semaphore, img_sema: threading.Semaphore, url: str, output_dir: str, limit: int):
+def sniff_image_format(header):
+    """
+    Identify an image format from its leading magic bytes.
+    Args:
+        header: At least the first 12 bytes of the image
+    Returns:
+        'jpeg', 'png', 'gif', 'bmp' or 'webp', or None if unrecognised
+    """
+    if header[:3] == b'\xff\xd8\xff':
+        return 'jpeg'
+    if header[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if header[:2] == b'BM':
+        return 'bmp'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalise an image URL for the tried_urls check.
+    The scheme and host are lowercased and the fragment dropped. The query
+    string is kept because many image hosts select the image through it.
+    """
+    parts = urllib.parse.urlsplit(url)
+    return urllib.parse.urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, parts.query, ''))
+
+
+def acquire_buffer() -> bytearray:
+    """Take a download buffer from the pool, allocating one if it is empty."""
+    try:
+        return buffer_pool.get_nowait()
+    except queue.Empty:
+        return bytearray(IMAGE_BUFFER_SIZE)
+
+
+def release_buffer(buffer: bytearray):
+    """Return a download buffer to the pool unless it grew past MAX_POOLED_BUFFER_SIZE."""
+    if len(buffer) <= MAX_POOLED_BUFFER_SIZE:
+        buffer_pool.put(buffer)
+
+
+async def download(url: str, output_dir: str, limit: int):
     """
     Download an image from the given URL with sequential naming.
     Args:
-        pool_sema: Semaphore to limit concurrent downloads
-        img_sema: Semaphore to control image processing
         url: URL of the image to download
         output_dir: Directory to save the image
         limit: Maximum number of images to download
     """
-    global in_progress, image_counter, successful_downloads
+    global image_counter, successful_downloads
 
-    if url in tried_urls:
+    # Claim the URL before fetching so no other download fetches it again.
+    # The claim is only kept once the body has been fetched and judged, so
+    # cancelled, timed-out, failed or over-limit downloads can be retried later.
+    url_key = canonical_url(url)
+    if url_key in tried_urls:
         print('SKIP: Already checked url, skipping')
         return
-    pool_sema.acquire()
-    in_progress += 1
-    acquired_img_sema = False
+    tried_urls.add(url_key)
+    keep_claim = False
 
     # Get the original file extension from the URL and clean it
     path = urllib.parse.urlsplit(url).path
@@ -70,142 +122,138 @@ def download(pool_sema: threading.Semaphore, img_sema: threading.Semaphore, url:
     _, file_extension = os.path.splitext(original_filename)
 
     # Clean the file extension (remove any extra characters like !d, etc.)
-    file_extension = file_extension.lower()  # Convert to lowercase
-    # Remove any non-alphanumeric characters after the dot, keep only the main extension
-    if '.' in file_extension:
-        # Extract just the main extension (e.g., .jpg from .jpg!d)
-        clean_extension = re.sub(r'[^a-zA-Z0-9]', '', file_extension[1:])  # Remove non-alphanumeric
-        if clean_extension in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp']:
-            file_extension = f'.{clean_extension}'
-        else:
-            file_extension = '.jpg'  # Default to jpg if unknown extension
-    else:
-        file_extension = '.jpg'  # Default to jpg if no extension found
+    # and default to jpg if it is missing or unknown
+    clean_extension = EXTENSION_JUNK_PATTERN.sub('', file_extension[1:].lower())
+    file_extension = f'.{clean_extension}' if clean_extension in ALLOWED_EXTENSIONS else '.jpg'
 
     # Generate filename with current counter (will be updated if successful)
     filename = f"Image{image_counter + 1}{file_extension}"
 
     try:
-        request = urllib.request.Request(url, None, urlopenheader)
-        image = urllib.request.urlopen(request, context=ssl_context).read()
-
-        # Determine the actual image format from content
-        image_format = imghdr.what(None, image)
-        if not image_format:
-            print('SKIP: Invalid image, not saving ' + filename)
-            return
-
-        # Update file extension based on actual image format
-        if image_format in ['jpeg', 'jpg']:
-            file_extension = '.jpg'
-        elif image_format == 'png':
-            file_extension = '.png'
-        else:
-            file_extension = '.jpg'  # Default fallback
-
-        # Update filename with correct extension
-        filename = f"Image{image_counter + 1}{file_extension}"
-
-        md5_key = hashlib.md5(image).hexdigest()
-        if md5_key in image_md5s:
-            print('SKIP: Image is a duplicate of ' + image_md5s[md5_key] + ', not saving ' + filename)
-            return
-
-        # Check if we've reached the limit
-        if limit is not None and successful_downloads >= limit:
-            return
-
-        # Check if the sequential filename already exists
-        if os.path.exists(os.path.join(output_dir, filename)):
-            # Check if the existing file is the same image (by MD5)
+        async with download_slots:
+            buffer = acquire_buffer()
+            image = None
             try:
-                with open(os.path.join(output_dir, filename), 'rb') as f:
-                    existing_md5 = hashlib.md5(f.read()).hexdigest()
-                if existing_md5 == md5_key:
-                    print('SKIP: Already downloaded ' + filename + ', not saving')
+                # Stream the body into the pooled buffer instead of a fresh bytes object
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    size = 0
+                    async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+                        buffer[size:size + len(chunk)] = chunk
+                        size += len(chunk)
+                keep_claim = True
+                image = memoryview(buffer)[:size]
+
+                # Determine the actual image format from content
+                image_format = sniff_image_format(bytes(image[:12]))
+                if not image_format:
+                    print('SKIP: Invalid image, not saving ' + filename)
                     return
-            except (OSError, IOError):
-                # File might be corrupted or unreadable, skip this image
-                print('SKIP: Corrupted file ' + filename + ', skipping')
-                return
-            # If different image, skip this one (we want exact limit)
-            print('SKIP: Filename conflict ' + filename + ', skipping')
-            return
 
-        image_md5s[md5_key] = filename
+                # Update file extension based on actual image format
+                if image_format in ['jpeg', 'jpg']:
+                    file_extension = '.jpg'
+                elif image_format == 'png':
+                    file_extension = '.png'
+                else:
+                    file_extension = '.jpg'  # Default fallback
 
-        img_sema.acquire()
-        acquired_img_sema = True
+                # Dedup only needs a fast content hash, not a cryptographic one
+                hash_key = xxhash.xxh3_64(image).hexdigest()
 
-        # Save the image to file
-        with open(os.path.join(output_dir, filename), 'wb') as imagefile:
-            imagefile.write(image)
-
-        # Only increment counter after successful save
-        image_counter += 1
-        successful_downloads += 1
-        print(" OK : " + filename)
-        tried_urls.append(url)
-    except Exception as e:
-        print(f"FAIL: {filename} - {str(e)}")
+                # Check for duplicates and the limit, and reserve the next image number
+                if hash_key in image_hashes:
+                    print('SKIP: Image is a duplicate of ' + image_hashes[hash_key] + ', not saving ' + filename)
+                    return
+                if limit is not None and successful_downloads >= limit:
+                    keep_claim = False
+                    return
+                image_counter += 1
+                successful_downloads += 1
+                filename = f"Image{image_counter}{file_extension}"
+                image_hashes[hash_key] = filename
+
+                # Save the image to file, never overwriting one left by an earlier run
+                try:
+                    with open(os.path.join(output_dir, filename), 'xb') as imagefile:
+                        imagefile.write(image)
+                except OSError:
+                    # Give the reservation back so another image can fill the limit
+                    successful_downloads -= 1
+                    del image_hashes[hash_key]
+                    keep_claim = False
+                    raise
+
+                print(" OK : " + filename)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"FAIL: {filename} - {str(e)}")
+            finally:
+                if image is not None:
+                    image.release()
+                release_buffer(buffer)
     finally:
-        pool_sema.release()
-        if acquired_img_sema:
-            img_sema.release()
-        in_progress -= 1
+        if not keep_claim:
+            tried_urls.discard(url_key)
 
 
-def fetch_images_from_keyword(pool_sema: threading.Semaphore, img_sema: threading.Semaphore, keyword: str,
-                              output_dir: str, filters: str, limit: int):
+async def fetch_images_from_keyword(keyword: str, output_dir: str, filters: str, limit: int):
     """
     Fetch images from Bing search results for a given keyword.
+    The links of each result page are downloaded concurrently, and the
+    page's downloads finish before the next page is requested.
     Args:
-        pool_sema: Semaphore to limit concurrent downloads
-        img_sema: Semaphore to control image processing
         keyword: Search keyword
         output_dir: Directory to save images
         filters: Search filters to apply
         limit: Maximum number of images to download
     """
     current_offset = 0
-    last_link = ''
+    first_link = ''
 
     while True:
-        time.sleep(SLEEP_INTERVAL)
-
-        if in_progress > MAX_CONCURRENT_DOWNLOADS:
-            continue
-
         # Build Bing search URL
         request_url = (f'https://www.bing.com/images/async?q={urllib.parse.quote_plus(keyword)}'
                       f'&first={current_offset}&count={DEFAULT_IMAGES_PER_REQUEST}'
                       f'&qft={filters or ""}')
 
         try:
-            request = urllib.request.Request(request_url, None, headers=urlopenheader)
-            response = urllib.request.urlopen(request, context=ssl_context)
-            html = response.read().decode('utf8')
-            image_links = re.findall('murl&quot;:&quot;(.*?)&quot;', html)
-
-            if not image_links:
-                print(f'FAIL: No search results for "{keyword}"')
-                return
-
-            if image_links[-1] == last_link:
-                return  # No new results
-
-            for link in image_links:
-                # Check if we've already reached the limit
+            async with session.get(request_url) as response:
+                response.raise_for_status()
+                html = (await response.read()).decode('utf8')
+
+            tasks = []
+            for match in MURL_PATTERN.finditer(html):
+                link = match.group(1)
+                if not tasks:
+                    if link == first_link:
+                        return  # Bing repeats its last page once results run out
+                    first_link = link
                 if limit is not None and successful_downloads >= limit:
-                    print(f"Reached limit of {limit} images, stopping downloads")
-                    return
-                thread = threading.Thread(target=download, args=(pool_sema, img_sema, link, output_dir, limit))
-                thread.start()
-                current_offset += 1
+                    break
+                tasks.append(asyncio.ensure_future(download(link, output_dir, limit)))
 
-            last_link = image_links[-1]
+            if not tasks:
+                if not first_link:
+                    print(f'FAIL: No search results for "{keyword}"')
+                return
 
-        except (urllib.error.URLError, urllib.error.HTTPError) as e:
+            current_offset += len(tasks)
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    await next_done
+                    # Check if we've already reached the limit
+                    if limit is not None and successful_downloads >= limit:
+                        print(f"Reached limit of {limit} images, stopping downloads")
+                        return
+            finally:
+                # Abandon the page's remaining downloads once the limit is hit
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             print(f'FAIL: Network error for "{keyword}": {str(e)}')
             return
         except Exception as e:
@@ -216,20 +264,23 @@ def fetch_images_from_keyword(pool_sema: threading.Semaphore, img_sema: threadin
 def backup_history(*args):
     """
     Backup download history to a pickle file.
-    Called on program exit or interrupt.
+    Called once on program exit, or on interrupt.
     """
     history_file_path = os.path.join(output_dir, 'download_history.pickle')
     try:
         with open(history_file_path, 'wb') as download_history:
-            pickle.dump(tried_urls, download_history)
-            # Create a copy to avoid modification during dumping
-            copied_image_md5s = dict(image_md5s)
-            pickle.dump(copied_image_md5s, download_history)
+            # Downloads only touch these on the event loop thread, which is
+            # the one running this (at exit or from the SIGINT handler), so
+            # they cannot change mid-dump and need no defensive copy
+            pickle.dump(list(tried_urls), download_history)
+            pickle.dump(image_hashes, download_history)
         print('Download history backed up successfully')
     except Exception as e:
         print(f'FAIL: Could not backup history: {str(e)}')
 
     if args:
+        # Interrupted: the history is already saved, so skip the exit-time backup
+        atexit.unregister(backup_history)
         exit(0)
 
 def load_download_history():
@@ -237,16 +288,17 @@ def load_download_history():
     history_file_path = os.path.join(output_dir, 'download_history.pickle')
     try:
         with open(history_file_path, 'rb') as download_history:
-            global tried_urls, image_md5s
-            tried_urls = pickle.load(download_history)
-            image_md5s = pickle.load(download_history)
+            global tried_urls, image_hashes
+            tried_urls = set(pickle.load(download_history))
+            image_hashes = pickle.load(download_history)
         print('Loaded previous download history')
     except (OSError, IOError):
         print('No previous download history found, starting fresh')
-        tried_urls = []
+        tried_urls = set()
+        image_hashes = {}
 
 
-def process_search_file(search_file_path, pool_sema, img_sema, output_dir_origin, filters, limit):
+async def process_search_file(search_file_path, output_dir_origin, filters, limit):
     """Process multiple keywords from a file."""
     try:
         with open(search_file_path, 'r') as input_file:
@@ -270,13 +322,38 @@ def process_search_file(search_file_path, pool_sema, img_sema, output_dir_origin
             os.makedirs(output_sub_dir)
 
         print(f"Processing keyword: {keyword}")
-        fetch_images_from_keyword(pool_sema, img_sema, keyword, output_sub_dir, filters, limit)
+        await fetch_images_from_keyword(keyword, output_sub_dir, filters, limit)
         print(f"Downloaded {successful_downloads} images for keyword: {keyword}")
-        backup_history()
-        time.sleep(DELAY_BETWEEN_KEYWORDS)
+        await asyncio.sleep(DELAY_BETWEEN_KEYWORDS)
 
 
-if __name__ == "__main__":
+async def run_downloads(args, output_dir_origin):
+    """
+    Open the shared HTTP session and run the requested searches.
+    Args:
+        args: Parsed command line arguments
+        output_dir_origin: Root output directory
+    """
+    global session, download_slots, buffer_pool
+    download_slots = asyncio.Semaphore(args.threads)
+    # Certificate verification is bypassed, as before
+    connector = aiohttp.TCPConnector(limit=args.threads, ssl=False)
+    timeout = aiohttp.ClientTimeout(sock_connect=DEFAULT_TIMEOUT, sock_read=DEFAULT_TIMEOUT)
+    try:
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=urlopenheader) as session:
+            if args.search_string:
+                print(f"Searching for: {args.search_string}")
+                await fetch_images_from_keyword(args.search_string, output_dir_origin, args.filters, args.limit)
+                print(f"Downloaded {successful_downloads} images for keyword: {args.search_string}")
+            elif args.search_file:
+                await process_search_file(args.search_file, output_dir_origin, args.filters, args.limit)
+    finally:
+        # Release the pooled buffers; a long-lived host process should not keep them between runs
+        buffer_pool = queue.Queue()
+
+
+def build_parser():
+    """Build the command line parser for the downloader."""
     parser = argparse.ArgumentParser(description='Bing image bulk downloader (image_downloader.py)')
     parser.add_argument('-s', '--search-string', help='Keyword to search', required=False)
     parser.add_argument('-f', '--search-file', help='Path to a file containing search strings line by line',
@@ -289,40 +366,50 @@ if __name__ == "__main__":
                         required=False)
     parser.add_argument('--limit', help='Make sure not to search for more than specified amount of images.',
                         required=False, type=int, default=DEFAULT_LIMIT)
-    parser.add_argument('--threads', help='Number of threads', type=int, default=DEFAULT_THREADS)
-    
-    args = parser.parse_args()
-    
-    # Validate arguments
-    if (not args.search_string) and (not args.search_file):
-        parser.error('Provide either search string or path to file containing search strings')
-    
+    parser.add_argument('--threads', help='Number of concurrent downloads', type=int, default=DEFAULT_THREADS)
+    return parser
+
+
+def main(args):
+    """
+    Download images as requested by the parsed command line arguments.
+    Can be called repeatedly in one process; the counters and history are
+    reset from the output directory on every call.
+    Args:
+        args: Namespace produced by build_parser()
+    """
+    global output_dir, image_counter, successful_downloads
+
     # Set output directory
-    if args.output:
-        output_dir = args.output
+    output_dir = args.output or DEFAULT_OUTPUT_DIR
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
-    
-    output_dir_origin = output_dir
-    
-    # Set up signal handler for graceful exit
-    signal.signal(signal.SIGINT, backup_history)
-    
+    image_counter = 0
+    successful_downloads = 0
+
     # Load previous download history
     load_download_history()
-    
+
     # Configure adult filter if requested
     if args.adult_filter_off:
         urlopenheader['Cookie'] = 'SRCHHPGUSR=ADLT=OFF'
+    else:
+        urlopenheader.pop('Cookie', None)
+
+    # Process search request
+    asyncio.run(run_downloads(args, output_dir))
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    
+    # Validate arguments
+    if (not args.search_string) and (not args.search_file):
+        parser.error('Provide either search string or path to file containing search strings')
     
-    # Create semaphores for thread control
-    pool_sema = threading.BoundedSemaphore(args.threads)
-    img_sema = threading.Semaphore()
+    # Save the download history once on exit, or straight away on interrupt
+    atexit.register(backup_history)
+    signal.signal(signal.SIGINT, backup_history)
     
-    # Process search request
-    if args.search_string:
-        print(f"Searching for: {args.search_string}")
-        fetch_images_from_keyword(pool_sema, img_sema, args.search_string, output_dir, args.filters, args.limit)
-        print(f"Downloaded {successful_downloads} images for keyword: {args.search_string}")
-    elif args.search_file:
-        process_search_file(args.search_file, pool_sema, img_sema, output_dir_origin, args.filters, args.limit)
+    main(args)
@@ -1,26 +1,36 @@
-from subprocess import Popen, PIPE
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import collocation_detector
+import csk_error_checker
+import image_downloader
+import yolo_json_to_csv
 
 
 def invoke_scripts(args):
+    """Run the four pipeline stages in this process.
 
-    p0 = Popen(['python', 'image_downloader.py', '--search-string', f'{args.image_search_term}', '--output', f'{args.image_output_dir}'], stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    out0, err0 = p0.communicate()
-    print(f"working0 with err {err0} and\n output {out0}")
+    Each stage consumes the previous stage's output, so they run in order,
+    but the CSK file the last stage checks against is loaded in the
+    background while the earlier stages run.
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        kb_future = executor.submit(csk_error_checker.load_kb, args.csk_in_dir)
 
-    p1 = Popen(['python', 'yolo_json_to_csv.py', '--input_dir', f'{args.image_output_dir}', '--output_dir', f'{args.yolo_output_dir}', '--yolo_dir', f'{args.yolo_dir}'], stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    out1, err1 = p1.communicate()
-    print(f"working1 with err {err1} and\n output {out1}")
+        image_downloader.main(image_downloader.build_parser().parse_args(
+            ['--search-string', args.image_search_term, '--output', args.image_output_dir]))
 
-    p2 = Popen(['python', 'collocation_detector.py', '--input_dir', f'{args.yolo_output_dir}', '--output_dir', f'{args.collocations_output_dir}'], stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    out2, err2 = p2.communicate()
-    print(f"working2 with err {err2} and\n output {out2}")
+        yolo_json_to_csv.main(yolo_json_to_csv.build_parser().parse_args(
+            ['--input_dir', args.image_output_dir, '--output_dir', args.yolo_output_dir, '--yolo_dir', args.yolo_dir]))
 
-    p3 = Popen(['python', 'csk_error_checker.py', '--csk_dir', f'{args.csk_in_dir}', '--inverted_index_dir', f'{args.index_dir}'],stdin=PIPE, stdout=PIPE, stderr=PIPE)
-    out3, err3 = p3.communicate()
-    print(f"working3 with err {err3} and\n output {out3}")
+        collocation_detector.main(collocation_detector.build_parser().parse_args(
+            ['--input_dir', args.yolo_output_dir, '--output_dir', args.collocations_output_dir]))
 
-if __name__ == '__main__':
+        csk_error_checker.main(csk_error_checker.build_parser().parse_args(
+            ['--csk_dir', args.csk_in_dir, '--inverted_index_dir', args.index_dir]), kb=kb_future.result())
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description='End to end script',
                                      usage="\n\npython main.py"
                                            "\t --image_output_dir "
@@ -74,6 +84,15 @@ if __name__ == '__main__':
                         default='output/tsv_files/inverted_index.tsv',
                         required=False,
                         help='Directory where inverted_index is stored (default: output/tsv_files/inverted_index.tsv)')
+    return parser
 
-    args = parser.parse_args()
+
+def run(image_search_term):
+    """Run the whole pipeline for a search term with the default directories."""
+    args = build_parser().parse_args(['--image_search_term', image_search_term])
+    invoke_scripts(args=args)
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
     invoke_scripts(args=args)
\ No newline at end of file
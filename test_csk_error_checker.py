@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the CSK error checker output
+"""
+
+import os
+import sys
+import tempfile
+
+import csk_error_checker
+
+# A small KB: rows are label1, columns label2, cells the allowed relations
+KB_CSV = (
+    ' ,person,car,dog\n'
+    'person,"is_near,overlapsWith","is_near,is_inside",is_near\n'
+    'car,is_near,"is_near,overlapsWith",is_near\n'
+    'dog,is_near,is_near,is_near\n'
+)
+
+INVERTED_INDEX = (
+    'person,overlapsWith,car\tImage1\n'      # overlapsWith between vehicles/person: excluded
+    'person,is_above,car\tImage1,Image2\n'   # relation not in the KB cell: error
+    'person,is_near,car\tImage3\n'           # allowed by the KB
+    'dog,overlapsWith,person\tImage4\n'      # overlapsWith with a non-vehicle label: error
+    'cat,is_near,person\tImage5\n'           # label not in the KB: skipped
+    'person,is_near\tImage6\n'               # triple without three parts: skipped
+    'person,weird,car\n'                     # no tab, so no image IDs: skipped
+    'car,is_below,person\tImage9\n'          # relation not in the KB cell: error
+    'car,overlapsWith,bus\tImage10\n'        # excluded before the KB lookup
+)
+
+EXPECTED_ERRORS = [
+    'Image1,Image2\tperson,is_above,car\tperson,is_near,is_inside,car\n',
+    'Image4\tdog,overlapsWith,person\tdog,is_near,person\n',
+    'Image9\tcar,is_below,person\tcar,is_near,person\n',
+]
+
+
+def run_check(workdir, chunk_rows):
+    """Run check_csk in workdir with the given chunk size and return the error lines"""
+    kb_path = os.path.join(workdir, 'kb.csv')
+    index_path = os.path.join(workdir, 'inverted_index.tsv')
+    with open(kb_path, 'w') as f:
+        f.write(KB_CSV)
+    with open(index_path, 'w') as f:
+        f.write(INVERTED_INDEX)
+
+    original_dir = os.getcwd()
+    original_chunk_rows = csk_error_checker.CHUNK_ROWS
+    os.chdir(workdir)
+    try:
+        os.makedirs(os.path.dirname(csk_error_checker.ERROR_FILE_PATH), exist_ok=True)
+        csk_error_checker.CHUNK_ROWS = chunk_rows
+        csk_error_checker.check_csk(kb_path, index_path)
+        with open(csk_error_checker.ERROR_FILE_PATH) as f:
+            return f.readlines()
+    finally:
+        csk_error_checker.CHUNK_ROWS = original_chunk_rows
+        os.chdir(original_dir)
+
+
+def test_csk_error_checker():
+    """Test the error set on the inline path and on the process-pool path"""
+    passed = True
+    for description, chunk_rows in (("inline", 100_000), ("process pool", 2)):
+        with tempfile.TemporaryDirectory() as workdir:
+            errors = run_check(workdir, chunk_rows)
+        ok = errors == EXPECTED_ERRORS
+        passed = passed and ok
+        print(f"{description}: {'PASSED' if ok else 'FAILED'}")
+        if not ok:
+            print(f"  expected: {EXPECTED_ERRORS}")
+            print(f"  got:      {errors}")
+
+    print("\nCSK error checker test completed!")
+    return passed
+
+
+if __name__ == "__main__":
+    sys.exit(0 if test_csk_error_checker() else 1)
@@ -7,31 +7,40 @@ and converts those outputs to CSV files. It is designed to be portable and easy
 Default image directory: static/Images
 """
 import os
-import json
-import csv
 import argparse
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
 from typing import List
 
+import orjson
+import pandas as pd
+
 # Default directory for images
 DEFAULT_IMAGES_DIR = os.path.join('static', 'Images')
 
 IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
 
+# darkflow JSON fields, flattened by pandas.json_normalize, and the CSV columns they become
+YOLO_FIELDS = ['label', 'confidence', 'topleft.x', 'topleft.y', 'bottomright.x', 'bottomright.y']
+CSV_COLUMNS = ['label', 'confidence', 'top_left_x', 'top_left_y', 'bottom_right_x', 'bottom_right_y']
+
+# Fewer files than this are converted inline; each takes ~1 ms
+PARALLEL_MIN_FILES = 100
+
 
 def rename_files(images_dir: str) -> None:
     """
     Rename all image files in the directory to a standard format: Image 1.jpg, Image 2.jpg, ...
     """
     i = 1
-    for filename in sorted(os.listdir(images_dir)):
-        if filename.lower().endswith(IMAGE_EXTENSIONS):
-            dst = f"Image {i}.jpg"
-            src = os.path.join(images_dir, filename)
-            dst = os.path.join(images_dir, dst)
-            if src != dst:
-                os.rename(src, dst)
-            i += 1
+    with os.scandir(images_dir) as entries:
+        image_entries = sorted((entry for entry in entries if entry.name.lower().endswith(IMAGE_EXTENSIONS)),
+                               key=lambda entry: entry.name)
+    for entry in image_entries:
+        dst = os.path.join(images_dir, f"Image {i}.jpg")
+        if entry.path != dst:
+            os.rename(entry.path, dst)
+        i += 1
 
 
 def ensure_dir_exists(directory: str) -> None:
@@ -44,7 +53,8 @@ def ensure_dir_exists(directory: str) -> None:
 def run_yolo_detector(yolo_dir: str, images_dir: str) -> None:
     """
     Run YOLO object detector to generate JSON outputs for images in images_dir.
-    Changes to the YOLO directory, runs the command, and returns to the original directory.
+    The command runs inside the YOLO directory; only the child process changes
+    directory, so callers sharing this process keep their working directory.
     """
     command = [
         'flow',
@@ -53,38 +63,51 @@ def run_yolo_detector(yolo_dir: str, images_dir: str) -> None:
         '--load', '../bin/yolo.weights',
         '--json'
     ]
-    original_dir = os.getcwd()
-    try:
-        os.chdir(yolo_dir)
-        subprocess.run(command, check=True)
-    finally:
-        os.chdir(original_dir)
+    subprocess.run(command, cwd=yolo_dir, check=True)
+
+
+def _convert_one(json_path: str, csv_path: str) -> None:
+    """
+    Convert a single darkflow JSON file to CSV.
+    darkflow writes one JSON array of detections per image, so the file is
+    parsed in one go with orjson and written out as a DataFrame.
+    """
+    with open(json_path, 'rb') as infile:
+        content = infile.read()
+    # An empty file means no detections and still gets a header-only CSV
+    detections = orjson.loads(content) if content.strip() else []
+    df = pd.json_normalize(detections).reindex(columns=YOLO_FIELDS)
+    df.columns = CSV_COLUMNS
+    df['BBox_area'] = (df['bottom_right_y'] - df['top_left_y']) * (df['bottom_right_x'] - df['top_left_x'])
+    df.to_csv(csv_path, index=False)
 
 
 def convert_json_to_csv(json_dir: str, output_dir: str) -> None:
     """
     Convert all JSON files in json_dir to CSV files in output_dir.
+    The files are independent, so at least PARALLEL_MIN_FILES of them are
+    converted across a process pool.
     """
     ensure_dir_exists(output_dir)
-    file_list = [f for f in os.listdir(json_dir) if f.endswith('.json')]
-    for json_file in file_list:
-        json_path = os.path.join(json_dir, json_file)
-        csv_filename = os.path.splitext(json_file)[0] + '.csv'
-        csv_path = os.path.join(output_dir, csv_filename)
-        with open(json_path, 'r') as infile, open(csv_path, 'w', newline='') as outfile:
-            csvwriter = csv.writer(outfile)
-            header = ["label", "confidence", "top_left_x", "top_left_y", "bottom_right_x", "bottom_right_y", "BBox_area"]
-            csvwriter.writerow(header)
-            for line in infile:
-                data = json.loads(line)
-                for obj in data:
-                    s = list(obj.values())
-                    area = (s[3]["y"] - s[2]["y"]) * (s[3]["x"] - s[2]["x"])
-                    row = [s[0], s[1], s[2]["x"], s[2]["y"], s[3]["x"], s[3]["y"], area]
-                    csvwriter.writerow(row)
-
-    
-if __name__ == "__main__":
+    with os.scandir(json_dir) as entries:
+        file_list = [entry for entry in entries if entry.name.endswith('.json')]
+    json_paths = [entry.path for entry in file_list]
+    csv_paths = [os.path.join(output_dir, os.path.splitext(entry.name)[0] + '.csv') for entry in file_list]
+    if len(file_list) < PARALLEL_MIN_FILES:
+        for json_path, csv_path in zip(json_paths, csv_paths):
+            _convert_one(json_path, csv_path)
+        return
+
+    workers = min(os.cpu_count() or 1, len(file_list))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Batch the small per-file tasks to keep inter-process overhead down
+        list(pool.map(_convert_one, json_paths, csv_paths, chunksize=max(1, len(file_list) // (4 * workers))))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command line parser for the converter.
+    """
     parser = argparse.ArgumentParser(
         description='Convert YOLO JSON outputs to CSV (yolo_json_to_csv.py)',
         usage="\n\npython yolo_json_to_csv.py"
@@ -112,8 +135,13 @@ if __name__ == "__main__":
                         dest='yolo_out_dir',
                         default='out',
                         help='Subdirectory (inside input_dir) where YOLO outputs JSON (default: out)')
-    args = parser.parse_args()
+    return parser
 
+
+def main(args: argparse.Namespace) -> None:
+    """
+    Rename the images, run YOLO on them and convert its JSON output to CSV.
+    """
     # Step 1: Ensure images directory exists and rename files
     ensure_dir_exists(args.input_dir)
     rename_files(args.input_dir)
@@ -125,3 +153,6 @@ if __name__ == "__main__":
     yolo_json_dir = os.path.join(args.input_dir, args.yolo_out_dir)
     convert_json_to_csv(yolo_json_dir, args.output_dir)
 
+
+if __name__ == "__main__":
+    main(build_parser().parse_args())